@@ -249,10 +249,7 @@ class NearestNeighborEnergyConstraint(NumpyConstraint):
 
     def remove_violating_sequences(self, seqs: dn.DNASeqList) -> dn.DNASeqList:
         """Remove sequences with nearest-neighbor energies outside of an interval."""
-        wcenergies = dn.calculate_wc_energies(seqs.seqarr, self.temperature)
-        within_range = (self.low_energy <= wcenergies) & (wcenergies <= self.high_energy)
-        seqarr_pass = seqs.seqarr[within_range]
-        return dn.DNASeqList(seqarr=seqarr_pass)
+        return seqs.filter_energy(self.low_energy, self.high_energy, self.temperature)
 
 
 @dataclass
@@ -327,7 +324,7 @@ class BaseEndConstraint(NumpyConstraint):
                              f'when sequences only have length {seqs.seqlen}')
 
         if self.five_prime:
-            good_left = np.zeros(shape=len(seqs), dtype=np.bool)
+            good_left = np.zeros(shape=len(seqs), dtype=np.bool_)
             left = seqs.seqarr[:, self.distance_from_end]
             for bits in all_bits:
                 if good_left is None:
@@ -336,7 +333,7 @@ class BaseEndConstraint(NumpyConstraint):
                     good_left |= (left == bits)
 
         if self.three_prime:
-            good_right = np.zeros(shape=len(seqs), dtype=np.bool)
+            good_right = np.zeros(shape=len(seqs), dtype=np.bool_)
             right = seqs.seqarr[:, -1 - self.distance_from_end]
             for bits in all_bits:
                 if good_right is None:
@@ -392,7 +389,7 @@ class BaseAtPositionConstraint(NumpyConstraint):
         if not 0 <= self.position < seqs.seqlen:
             raise ValueError(f'position must be between 0 and {seqs.seqlen} but it is {self.position}')
         mid = seqs.seqarr[:, self.position]
-        good = np.zeros(shape=len(seqs), dtype=np.bool)
+        good = np.zeros(shape=len(seqs), dtype=np.bool_)
         for base in self.bases:
             good |= (mid == dn.base2bits[base])
         seqarr_pass = seqs.seqarr[good]
@@ -434,18 +431,7 @@ class ForbiddenSubstringConstraint(NumpyConstraint):
         """Remove sequences that have a string in :py:data:`ForbiddenSubstringConstraint.substrings`
         as a substring."""
         assert isinstance(self.substrings, list)
-        sub_len = len(self.substrings[0])
-        sub_ints = [[dn.base2bits[base] for base in sub] for sub in self.substrings]
-        pow_arr = [4 ** k for k in range(sub_len)]
-        sub_vals = np.dot(sub_ints, pow_arr)
-        toeplitz = dn.create_toeplitz(seqs.seqlen, sub_len)
-        convolution = np.dot(toeplitz, seqs.seqarr.transpose())
-        pass_all = np.ones(seqs.numseqs, dtype=np.bool)
-        for sub_val in sub_vals:
-            pass_sub = np.all(convolution != sub_val, axis=0)
-            pass_all = pass_all & pass_sub
-        seqarr_pass = seqs.seqarr[pass_all]
-        return dn.DNASeqList(seqarr=seqarr_pass)
+        return seqs.filter_substring(self.substrings)
 
 
 @dataclass
@@ -12,14 +12,30 @@ Woods\*, Doty\*, Myhrvold, Hui, Zhou, Yin, Winfree. (\*Joint first co-authors)
 
 # from __future__ import annotations
 
-from typing import Tuple, List, Collection, Optional, Union, Sequence, Dict
+from typing import Tuple, List, Collection, Optional, Union, Sequence, Dict, Iterator
 from dataclasses import dataclass
 import math
 import itertools as it
 from functools import lru_cache
+import hashlib
+from multiprocessing.pool import ThreadPool
+import os
+import mmap
+import threading
+import weakref
 
 import numpy as np
 
+try:
+    import numba  # type: ignore
+except ImportError:
+    numba = None
+
+try:
+    import xxhash  # type: ignore
+except ImportError:
+    xxhash = None
+
 default_rng: np.random.Generator = np.random.default_rng()  # noqa
 
 bits2base = ['A', 'C', 'G', 'T']
@@ -36,9 +52,31 @@ def idx2seq(idx: int, length: int) -> str:
     return ''.join(seq)
 
 
+# lookup tables between ASCII codes of bases and their 2-bit codes; 255 marks a non-DNA character
+_base2bits_lut = np.full(256, 255, dtype=np.ubyte)
+for _base, _bits in base2bits.items():
+    _base2bits_lut[ord(_base)] = _bits
+_bits2base_lut = np.frombuffer(''.join(bits2base).encode('ascii'), dtype=np.ubyte)
+
+
+def _ascii2bits(seqs_ascii: str) -> np.ndarray:
+    # 1D numpy array of 2-bit codes of bases in string
+    try:
+        seqs_bytes = seqs_ascii.encode('ascii')
+    except UnicodeEncodeError as error:
+        bad_char = seqs_ascii[error.start]
+        raise ValueError(f'DNA sequences must contain only bases {bits2base}, but found {bad_char!r}')
+    arr = _base2bits_lut[np.frombuffer(seqs_bytes, dtype=np.ubyte)]
+    not_bases = arr == 255
+    if np.any(not_bases):
+        bad_char = seqs_ascii[np.argmax(not_bases)]
+        raise ValueError(f'DNA sequences must contain only bases {bits2base}, but found {bad_char!r}')
+    return arr
+
+
 def seq2arr(seq: str) -> np.ndarray:
     """Convert seq (string with DNA alphabet) to numpy array with integers 0,1,2,3."""
-    return np.array([base2bits[base] for base in seq], dtype=np.ubyte)
+    return _ascii2bits(seq)
 
 
 def seqs2arr(seqs: Sequence[str]) -> np.ndarray:
@@ -50,15 +88,121 @@ def seqs2arr(seqs: Sequence[str]) -> np.ndarray:
         if len(seq) != seq_len:
             raise ValueError('All sequences in seqs must be equal length')
     num_seqs = len(seqs)
-    arr = np.empty((num_seqs, seq_len), dtype=np.ubyte)
-    for i in range(num_seqs):
-        arr[i] = [base2bits[base] for base in seqs[i]]
-    return arr
+    return _ascii2bits(''.join(seqs)).reshape(num_seqs, seq_len)
 
 
 def arr2seq(arr: np.ndarray) -> str:
-    bases_ch = [bits2base[base] for base in arr]
-    return ''.join(bases_ch)
+    return _bits2base_lut[arr].tobytes().decode('ascii')
+
+
+def arr2seqs(arr: np.ndarray) -> List[str]:
+    """Return list of DNA sequences represented by the rows of 2D numpy array `arr`."""
+    num_seqs, seq_len = arr.shape
+    if seq_len == 0:
+        return [''] * num_seqs
+    seqs_bytes = _bits2base_lut[arr].tobytes()
+    return [seqs_bytes[i:i + seq_len].decode('ascii') for i in range(0, num_seqs * seq_len, seq_len)]
+
+
+bases_per_word = 32
+"""Number of bases packed into each 64-bit word by :py:func:`pack_seqarr`."""
+
+
+def pack_seqarr(seqarr: np.ndarray) -> np.ndarray:
+    """Return 2D numpy array of dtype uint64 packing each row of `seqarr` at 2 bits per base.
+
+    The result has shape ``(numseqs, ceil(seqlen/32))``. Base ``i`` of a row is stored in bits
+    ``2*(i%32)`` and ``2*(i%32)+1`` of word ``i//32``, using the same code
+    :math:`A \\to 0, C \\to 1, G \\to 2, T \\to 3` as :py:data:`DNASeqList.seqarr`.
+    Unused high bits of the last word are 0."""
+    numseqs, seqlen = seqarr.shape
+    numwords = (seqlen + bases_per_word - 1) // bases_per_word
+    packed = np.zeros((numseqs, numwords), dtype=np.uint64)
+    for pos in range(seqlen):
+        word, offset = divmod(pos, bases_per_word)
+        packed[:, word] |= seqarr[:, pos].astype(np.uint64) << np.uint64(2 * offset)
+    return packed
+
+
+def _packed_rows_keys(packed: np.ndarray) -> List[Union[int, Tuple[int, ...]]]:
+    # hashable keys for rows of array packed by pack_seqarr: an int if rows are one word, else a tuple
+    if packed.shape[1] == 1:
+        return packed[:, 0].tolist()
+    return list(map(tuple, packed.tolist()))
+
+
+_even_bits = np.uint64(0x5555555555555555)
+_bit_pairs = np.uint64(0x3333333333333333)
+_nibbles = np.uint64(0x0f0f0f0f0f0f0f0f)
+_bytes_ones = np.uint64(0x0101010101010101)
+
+
+def hamming_distances(seqarr: np.ndarray, arr: np.ndarray) -> np.ndarray:
+    """Return Hamming distances between each row of 2D array `seqarr` and 1D array `arr`."""
+    if numba is None:
+        return hamming_distances_packed(pack_seqarr(seqarr), pack_seqarr(arr.reshape(1, -1)))
+    distances = np.empty(seqarr.shape[0], dtype=np.int64)
+    _hamming_distances_numba(seqarr, arr, distances)
+    return distances
+
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True, boundscheck=False)
+    def _hamming_distances_numba(seqarr: np.ndarray, arr: np.ndarray, distances: np.ndarray) -> None:
+        # the inner loop compiles to vectorized byte compares, one SIMD register covering a whole row
+        numseqs, seqlen = seqarr.shape
+        for i in numba.prange(numseqs):
+            distance = 0
+            for j in range(seqlen):
+                distance += seqarr[i, j] != arr[j]
+            distances[i] = distance
+
+    @numba.njit(cache=True, boundscheck=False)
+    def _filter_hamming_numba(seqarr: np.ndarray, order: np.ndarray, threshold: int,
+                              kept_idxs: np.ndarray) -> int:
+        # greedy pass of DNASeqList.filter_hamming; returns number of indices written to kept_idxs
+        seqlen = seqarr.shape[1]
+        num_kept = 0
+        for idx in order:
+            far_from_kept = True
+            for k in range(num_kept):
+                kept_idx = kept_idxs[k]
+                distance = 0
+                for j in range(seqlen):
+                    distance += seqarr[idx, j] != seqarr[kept_idx, j]
+                if distance < threshold:
+                    far_from_kept = False
+                    break
+            if far_from_kept:
+                kept_idxs[num_kept] = idx
+                num_kept += 1
+        return num_kept
+
+
+# maximum number of candidate sequences, and of 64-bit words in the candidates-by-kept distance
+# computation, per block in DNASeqList.filter_hamming
+_hamming_block_size = 4096
+_hamming_block_elements = 2 ** 22
+
+
+def hamming_distances_packed(packed1: np.ndarray, packed2: np.ndarray) -> np.ndarray:
+    """Return Hamming distances (number of mismatched bases) between rows of `packed1` and `packed2`,
+    which are arrays packed by :py:func:`pack_seqarr` (broadcast against each other along all but the
+    last axis)."""
+    xor = packed1 ^ packed2
+    # a base differs if either of its two bits differs; collapse that onto the low bit of each pair
+    diff = (xor | (xor >> np.uint64(1))) & _even_bits
+    return np.sum(_popcount64(diff), axis=-1, dtype=np.int64)
+
+
+def _popcount64(words: np.ndarray) -> np.ndarray:
+    # number of 1 bits in each element of uint64 array words
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    counts = words - ((words >> np.uint64(1)) & _even_bits)
+    counts = (counts & _bit_pairs) + ((counts >> np.uint64(2)) & _bit_pairs)
+    counts = (counts + (counts >> np.uint64(4))) & _nibbles
+    return (counts * _bytes_ones) >> np.uint64(56)
 
 
 def make_array_with_all_dna_seqs(length: int, bases: Collection[str] = ('A', 'C', 'G', 'T')) -> np.ndarray:
@@ -77,37 +221,38 @@ def make_array_with_all_dna_seqs(length: int, bases: Collection[str] = ('A', 'C'
 
     num_bases = len(bases)
     num_seqs = num_bases ** length
+    base_bits = np.array([base2bits[base] for base in bases], dtype=np.ubyte)
 
-    #     shift = np.arange(2*(length-1), -1, -2)
-    #     nums = np.repeat(np.arange(numseqs), length)
-    #     nums2D = nums.reshape([numseqs, length])
-    #     shifts = np.tile(0b11 << shift, numseqs)
-    #     shifts2D = shifts.reshape([numseqs, length])
-    #     arr = (shifts2D & nums2D) >> shift
-
-    # the former code took up too much memory (using int32 or int64)
-    # the following code makes sure it's 1 byte per base
-    powers_num_bases = [num_bases ** k for k in range(length)]
-    #         bases = np.array([_base2bits['A'], _base2bits['C'], _base2bits['G'], _base2bits['T']], dtype=np.ubyte)
-    base_bits = [base2bits[base] for base in bases]
-    bases = np.array(base_bits, dtype=np.ubyte)
-
-    list_of_arrays = False
-    if list_of_arrays:
-        # this one seems to be faster but takes more memory, probably because just before the last command
-        # there are two copies of the array in memory at once
-        columns = []
-        for i, j, c in zip(reversed(powers_num_bases), powers_num_bases, list(range(length))):
-            columns.append(np.tile(np.repeat(bases, i), j))
-        arr = np.vstack(columns).transpose()
-    else:
-        # this seems to be slightly slower but takes less memory, since it
-        # allocates only the final array, plus one extra column of that
-        # array at a time
-        arr = np.empty((num_seqs, length), dtype=np.ubyte)
-        for i, j, c in zip(reversed(powers_num_bases), powers_num_bases, list(range(length))):
-            arr[:, c] = np.tile(np.repeat(bases, i), j)
+    # The first num_bases ** k rows, restricted to the last k columns, hold all sequences of length k
+    # in order. Going from k to k + 1 copies that block once per remaining base, then fills column
+    # length - 1 - k with each base. Viewing the rows as (base, row within block) makes each step two
+    # broadcast stores with no temporaries, so only the final array (1 byte per base) is allocated.
+    arr = np.empty((num_seqs, length), dtype=np.ubyte)
+    block_rows = 1
+    for c in range(length - 1, -1, -1):
+        blocks = arr[:num_bases * block_rows].reshape(num_bases, block_rows, length)
+        blocks[1:, :, c + 1:] = blocks[0, :, c + 1:]
+        blocks[:, :, c] = base_bits[:, None]
+        block_rows *= num_bases
+    return arr
 
+
+def _idxs_to_seqarr(idxs: np.ndarray, length: int, base_bits: np.ndarray) -> np.ndarray:
+    # Row i holds the digits of idxs[i] in base num_bases, most significant first, with digit d
+    # representing the base with bits base_bits[d]. Used for sampled indices; when all indices
+    # are wanted, make_array_with_all_dna_seqs fills columns directly instead.
+    num_bases = len(base_bits)
+    idx_type = idxs.dtype.type
+    bits_per_base = num_bases.bit_length() - 1
+    num_bases_is_power_of_two = num_bases == 1 << bits_per_base
+    bases_are_digits = np.array_equal(base_bits, np.arange(num_bases))
+    arr = np.empty((len(idxs), length), dtype=np.ubyte)
+    for c in range(length):
+        if num_bases_is_power_of_two:
+            digits = (idxs >> idx_type(bits_per_base * (length - 1 - c))) & idx_type(num_bases - 1)
+        else:
+            digits = (idxs // idx_type(num_bases ** (length - 1 - c))) % idx_type(num_bases)
+        arr[:, c] = digits if bases_are_digits else base_bits[digits]
     return arr
 
 
@@ -120,6 +265,8 @@ def make_array_with_random_subset_of_dna_seqs(length: int, num_seqs: int,
 
     Uses the encoding described in the documentation for DNASeqList. The result is a 2D array,
     where each row represents a DNA sequence, and that row has one byte per base.
+    The rows are distinct; if `num_seqs` is at least the number of DNA sequences of the given length,
+    all of them are returned.
 
     :param length: length of each row
     :param num_seqs: number of rows
@@ -134,12 +281,27 @@ def make_array_with_random_subset_of_dna_seqs(length: int, num_seqs: int,
     elif len(bases) == 1:
         raise ValueError('bases must have at least two elements')
 
-    base_bits = np.array([base2bits[base] for base in bases], dtype=np.ubyte)
+    base_bits = np.sort(np.array([base2bits[base] for base in bases], dtype=np.ubyte))
+
+    num_bases = len(base_bits)
+    num_all_seqs = num_bases ** length
+    if num_all_seqs < 2 ** 63:
+        # sample distinct sequences by their lexicographic index, so no duplicates need to be removed
+        idxs = rng.choice(num_all_seqs, size=min(num_seqs, num_all_seqs), replace=False, shuffle=False)
+        idxs = np.sort(idxs.astype(np.uint64))
+        return _idxs_to_seqarr(idxs, length, base_bits)
 
-    arr = rng.choice(a=base_bits, size=(num_seqs, length))
-    unique_sorted_arr = np.unique(arr, axis=0)
+    # too many sequences to index with 64-bit integers; duplicates are astronomically unlikely,
+    # but remove any by comparing packed rows (ceil(length/32) words each rather than length bytes),
+    # then put the rows in lexicographic order (the packed words do not compare lexicographically)
+    arr = base_bits[rng.integers(num_bases, size=(num_seqs, length))]
+    _, unique_idxs = np.unique(pack_seqarr(arr), axis=0, return_index=True)
+    arr = arr[unique_idxs]
+    return arr[np.lexsort(arr.T[::-1])]
 
-    return unique_sorted_arr
+
+# Common substring lengths are stored as int16 in the dynamic programming tables below.
+_max_dp_seqlen = np.iinfo(np.int16).max
 
 
 # @lru_cache(maxsize=10000000)
@@ -148,15 +310,23 @@ def longest_common_substring(a1: np.ndarray, a2: np.ndarray, vectorized: bool =
     substring (subarray) of 1D arrays a1 and a2."""
     assert len(a1.shape) == 1
     assert len(a2.shape) == 1
-    counter = np.zeros(shape=(len(a1) + 1, len(a2) + 1), dtype=np.int)
+    if vectorized and numba is not None:
+        a1idxs, a2idxs, lens = _longest_common_substrings_pairs(a1.reshape(1, -1), a2.reshape(1, -1))
+        if lens[0] == 0:
+            return -1, -1, 0
+        return int(a1idxs[0]), int(a2idxs[0]), int(lens[0])
+    assert max(len(a1), len(a2)) <= _max_dp_seqlen
+    counter = np.zeros(shape=(len(a1) + 1, len(a2) + 1), dtype=np.int16)
     a1idx_longest = a2idx_longest = -1
     len_longest = 0
 
     if vectorized:
+        # idx is a view of idx_shifted offset by one, so idx_shifted[0] stays False
+        idx_shifted = np.zeros(len(a2) + 1, dtype=np.bool_)
+        idx = idx_shifted[1:]
         for i1 in range(len(a1)):
-            idx = (a2 == a1[i1])
-            idx_shifted = np.hstack([[False], idx])
-            counter[i1 + 1, idx_shifted] = counter[i1, idx] + 1
+            np.equal(a2, a1[i1], out=idx)
+            counter[i1 + 1, idx_shifted] = counter[i1, :-1][idx] + 1
         idx_longest = np.unravel_index(np.argmax(counter), counter.shape)
         if idx_longest[0] > 0:
             len_longest = counter[idx_longest]
@@ -172,7 +342,7 @@ def longest_common_substring(a1: np.ndarray, a2: np.ndarray, vectorized: bool =
                         len_longest = c
                         a1idx_longest = i1 + 1 - c
                         a2idx_longest = i2 + 1 - c
-    return a1idx_longest, a2idx_longest, len_longest
+    return a1idx_longest, a2idx_longest, int(len_longest)
 
 
 # @lru_cache(maxsize=10000000)
@@ -188,12 +358,14 @@ def longest_common_substrings_singlea1(a1: np.ndarray, a2s: np.ndarray) \
     numa2s = a2s.shape[0]
     len_a1 = len(a1)
     len_a2 = a2s.shape[1]
-    counter = np.zeros(shape=(len_a1 + 1, numa2s, len_a2 + 1), dtype=np.int)
+    assert max(len_a1, len_a2) <= _max_dp_seqlen
+    counter = np.zeros(shape=(len_a1 + 1, numa2s, len_a2 + 1), dtype=np.int16)
 
+    idx_shifted = np.zeros(shape=(numa2s, len_a2 + 1), dtype=np.bool_)
+    idx = idx_shifted[:, 1:]
     for i1 in range(len(a1)):
-        idx = (a2s == a1[i1])
-        idx_shifted = np.insert(idx, 0, np.zeros(numa2s, dtype=np.bool), axis=1)
-        counter[i1 + 1, idx_shifted] = counter[i1, idx] + 1
+        np.equal(a2s, a1[i1], out=idx)
+        counter[i1 + 1, idx_shifted] = counter[i1, :, :-1][idx] + 1
 
     counter = np.swapaxes(counter, 0, 1)
 
@@ -201,13 +373,28 @@ def longest_common_substrings_singlea1(a1: np.ndarray, a2s: np.ndarray) \
     idx_longest_raveled = np.argmax(counter_flat, axis=1)
     len_longest = counter_flat[np.arange(counter_flat.shape[0]), idx_longest_raveled]
 
-    idx_longest = np.unravel_index(idx_longest_raveled, dims=(len_a1 + 1, len_a2 + 1))
+    idx_longest = np.unravel_index(idx_longest_raveled, shape=(len_a1 + 1, len_a2 + 1))
     a1idx_longest = idx_longest[0] - len_longest
     a2idx_longest = idx_longest[1] - len_longest
 
     return a1idx_longest, a2idx_longest, len_longest
 
 
+# approximate number of bytes of working memory per block of pairs in longest_common_substrings_product,
+# chosen to fit in a typical L2 cache
+_pairs_block_bytes = 2 ** 20
+
+_thread_pool: Optional[ThreadPool] = None
+
+
+def _get_thread_pool() -> ThreadPool:
+    # created lazily so that importing this module does not start threads
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPool(processes=os.cpu_count())
+    return _thread_pool
+
+
 # @lru_cache(maxsize=10000000)
 def longest_common_substrings_product(a1s: np.ndarray, a2s: np.ndarray) \
         -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
@@ -218,21 +405,66 @@ def longest_common_substrings_product(a1s: np.ndarray, a2s: np.ndarray) \
     length[i] to see if any substrings actually matched."""
     numa1s = a1s.shape[0]
     numa2s = a2s.shape[0]
-    a1s_cp = np.repeat(a1s, numa2s, axis=0)
-    a2s_cp = np.tile(a2s, (numa1s, 1))
-
-    a1idx_longest, a2idx_longest, len_longest = _longest_common_substrings_pairs(a1s_cp, a2s_cp)
+    len_a1 = a1s.shape[1]
+    len_a2 = a2s.shape[1]
 
-    a1idx_longest = a1idx_longest.reshape(numa1s, numa2s)
-    a2idx_longest = a2idx_longest.reshape(numa1s, numa2s)
-    len_longest = len_longest.reshape(numa1s, numa2s)
+    a1idx_longest = np.empty((numa1s, numa2s), dtype=np.int64)
+    a2idx_longest = np.empty((numa1s, numa2s), dtype=np.int64)
+    len_longest = np.empty((numa1s, numa2s), dtype=np.int64)
+
+    # process the cross product a few rows of a1s at a time, so that the expanded pairs and the
+    # dynamic programming rows for them fit in cache, rather than expanding all pairs up front
+    bytes_per_pair = len_a1 + len_a2 + 4 * (len_a2 + 1)
+    pairs_per_block = max(1, _pairs_block_bytes // bytes_per_pair)
+    a1s_per_block = max(1, pairs_per_block // max(1, numa2s))
+
+    def process_block(start: int) -> None:
+        end = min(start + a1s_per_block, numa1s)
+        a1s_cp = np.repeat(a1s[start:end], numa2s, axis=0)
+        a2s_cp = np.tile(a2s, (end - start, 1))
+        a1idx_block, a2idx_block, len_block = _longest_common_substrings_pairs(a1s_cp, a2s_cp)
+        a1idx_longest[start:end] = a1idx_block.reshape(end - start, numa2s)
+        a2idx_longest[start:end] = a2idx_block.reshape(end - start, numa2s)
+        len_longest[start:end] = len_block.reshape(end - start, numa2s)
+
+    starts = range(0, numa1s, a1s_per_block)
+    if numba is None and len(starts) > 1:
+        # blocks are independent and write to disjoint rows of the output, so they can be processed
+        # by threads sharing the inputs and outputs; numpy releases the GIL in its inner loops.
+        # With numba the kernel already runs in parallel over pairs within each block.
+        _get_thread_pool().map(process_block, starts)
+    else:
+        for start in starts:
+            process_block(start)
 
     return a1idx_longest, a2idx_longest, len_longest
 
 
 def pair_index(n: int) -> np.ndarray:
-    index = np.fromiter(it.chain.from_iterable(it.combinations(range(n), 2)), int, count=n * (n - 1))
-    return index.reshape(-1, 2)
+    """Return 2D array whose rows are all pairs (i, j) with 0 <= i < j < n, in lexicographic order."""
+    i, j = np.triu_indices(n, k=1)
+    return np.stack([i, j], axis=1)
+
+
+def pair_index_blocks(n: int, max_pairs: int) -> Iterator[np.ndarray]:
+    """Yield the rows of :py:func:`pair_index` (`n`) in consecutive blocks, each with at most `max_pairs`
+    rows unless the pairs (i, j) for a single i already exceed that. This allows processing all pairs
+    without allocating all of them at once."""
+    i_start = 0
+    while i_start < n - 1:
+        # take pairs for i in range(i_start, i_end); there are n-1-i of them for each i
+        i_end = i_start + 1
+        num_pairs = n - 1 - i_start
+        while i_end < n - 1 and num_pairs + (n - 1 - i_end) <= max_pairs:
+            num_pairs += n - 1 - i_end
+            i_end += 1
+        i = np.arange(i_start, i_end)
+        counts = n - 1 - i
+        i_rep = np.repeat(i, counts)
+        first_pair_of_i = np.repeat(np.cumsum(counts) - counts, counts)
+        j = i_rep + 1 + np.arange(num_pairs) - first_pair_of_i
+        yield np.stack([i_rep, j], axis=1)
+        i_start = i_end
 
 
 def _longest_common_substrings_pairs(a1s: np.ndarray, a2s: np.ndarray) \
@@ -241,30 +473,138 @@ def _longest_common_substrings_pairs(a1s: np.ndarray, a2s: np.ndarray) \
     assert len(a2s.shape) == 2
     assert a1s.shape[0] == a2s.shape[0]
 
+    if numba is None:
+        if a2s.shape[1] <= 64:
+            return _longest_common_substrings_pairs_bit_parallel(a1s, a2s)
+        return _longest_common_substrings_pairs_numpy(a1s, a2s)
+
+    numpairs = a1s.shape[0]
+    a1idx_longest = np.empty(numpairs, dtype=np.int64)
+    a2idx_longest = np.empty(numpairs, dtype=np.int64)
+    len_longest = np.empty(numpairs, dtype=np.int64)
+    _longest_common_substrings_pairs_numba(a1s, a2s, a1idx_longest, a2idx_longest, len_longest)
+    return a1idx_longest, a2idx_longest, len_longest
+
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True, boundscheck=False)
+    def _longest_common_substrings_pairs_numba(a1s: np.ndarray, a2s: np.ndarray,
+                                               a1idx_longest: np.ndarray, a2idx_longest: np.ndarray,
+                                               len_longest: np.ndarray) -> None:
+        # Walks each diagonal i2 - i1 = offset of the dynamic programming table, so no table is stored.
+        # Among substrings of maximum length, picks the one ending at the lexicographically smallest
+        # (i1, i2), as np.argmax does on the table in _longest_common_substrings_pairs_numpy.
+        numpairs, len_a1 = a1s.shape
+        len_a2 = a2s.shape[1]
+        for pair in numba.prange(numpairs):
+            best_len = 0
+            best_i1 = 0
+            best_i2 = 0
+            for offset in range(1 - len_a1, len_a2):
+                i1 = max(0, -offset)
+                i2 = i1 + offset
+                run = 0
+                while i1 < len_a1 and i2 < len_a2:
+                    if a1s[pair, i1] == a2s[pair, i2]:
+                        run += 1
+                        if run > best_len or (run == best_len and (i1 + 1 < best_i1 or
+                                                                   (i1 + 1 == best_i1 and i2 + 1 < best_i2))):
+                            best_len = run
+                            best_i1 = i1 + 1
+                            best_i2 = i2 + 1
+                    else:
+                        run = 0
+                    i1 += 1
+                    i2 += 1
+            a1idx_longest[pair] = best_i1 - best_len
+            a2idx_longest[pair] = best_i2 - best_len
+            len_longest[pair] = best_len
+
+
+def _longest_common_substrings_pairs_bit_parallel(a1s: np.ndarray, a2s: np.ndarray) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Bit-parallel version of _longest_common_substrings_pairs_numpy for rows of a2s of length <= 64,
+    # storing a whole row of the dynamic programming table for a pair in one uint64 word.
+    # Instead of counting substring lengths, iteration k marks, for each position of a1,
+    # the positions of a2 at which common substrings of length k end; the last nonzero iteration
+    # gives the length of the longest one, and its first (lowest) marked position is the one
+    # found by np.argmax in _longest_common_substrings_pairs_numpy.
+    numpairs, len_a1 = a1s.shape
+    len_a2 = a2s.shape[1]
+    assert len_a2 <= 64
+    pair_idxs = np.arange(numpairs)
+
+    # base_masks[b, pair] has bit i2 set if a2s[pair, i2] == b
+    base_masks = np.zeros((4, numpairs), dtype=np.uint64)
+    for i2 in range(len_a2):
+        base_masks[a2s[:, i2], pair_idxs] |= np.uint64(1) << np.uint64(i2)
+    # matches[pair, i1] has bit i2 set if a1s[pair, i1] == a2s[pair, i2]
+    matches = base_masks[a1s, pair_idxs[:, np.newaxis]]
+
+    len_longest = np.zeros(numpairs, dtype=np.int64)
+    i1_longest = np.zeros(numpairs, dtype=np.int64)
+    i2_longest = np.zeros(numpairs, dtype=np.int64)
+
+    # at iteration k, ends[pair, c] has bit i2 set if a1s[pair, c : c+k] == a2s[pair, i2-k+1 : i2+1]
+    ends = matches
+    length = 1
+    while True:
+        nonzero = ends != 0
+        found = np.any(nonzero, axis=1)
+        if not np.any(found):
+            break
+        first_c = np.argmax(nonzero[found], axis=1)
+        ends_first_c = ends[found, first_c]
+        lowest_bit = ends_first_c & (~ends_first_c + np.uint64(1))
+        len_longest[found] = length
+        i1_longest[found] = first_c + length
+        i2_longest[found] = _popcount64(lowest_bit - np.uint64(1)).astype(np.int64) + 1
+        ends = (ends[:, :-1] << np.uint64(1)) & matches[:, length:]
+        length += 1
+
+    a1idx_longest = i1_longest - len_longest
+    a2idx_longest = i2_longest - len_longest
+
+    return a1idx_longest, a2idx_longest, len_longest
+
+
+def _longest_common_substrings_pairs_numpy(a1s: np.ndarray, a2s: np.ndarray) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     numpairs = a1s.shape[0]
 
     len_a1 = a1s.shape[1]
     len_a2 = a2s.shape[1]
 
-    counter = np.zeros(shape=(len_a1 + 1, numpairs, len_a2 + 1), dtype=np.int)
+    # only rows i1 and i1+1 of the dynamic programming table are needed at once,
+    # so keep two rows and track the position of the longest substring seen so far
+    assert max(len_a1, len_a2) <= _max_dp_seqlen
+    counter_prev = np.zeros(shape=(numpairs, len_a2 + 1), dtype=np.int16)
+    counter_cur = np.zeros(shape=(numpairs, len_a2 + 1), dtype=np.int16)
+    len_longest = np.zeros(numpairs, dtype=np.int64)
+    i1_longest = np.zeros(numpairs, dtype=np.int64)
+    i2_longest = np.zeros(numpairs, dtype=np.int64)
+    pair_idxs = np.arange(numpairs)
 
-    for i1 in range(len_a1):
-        a1s_cp_col = a1s[:, i1].reshape(numpairs, 1)
-        a1s_cp_col_rp = np.repeat(a1s_cp_col, len_a2, axis=1)
+    # idx is a view of idx_shifted offset by one column, so column 0 of idx_shifted stays False
+    idx_shifted = np.zeros(shape=(numpairs, len_a2 + 1), dtype=np.bool_)
+    idx = idx_shifted[:, 1:]
 
-        idx = (a2s == a1s_cp_col_rp)
-        idx_shifted = np.hstack([np.zeros(shape=(numpairs, 1), dtype=np.bool), idx])
-        counter[i1 + 1, idx_shifted] = counter[i1, idx] + 1
+    for i1 in range(len_a1):
+        np.equal(a2s, a1s[:, i1:i1 + 1], out=idx)
+        counter_cur.fill(0)
+        counter_cur[idx_shifted] = counter_prev[:, :-1][idx] + 1
 
-    counter = np.swapaxes(counter, 0, 1)
+        i2_longest_row = np.argmax(counter_cur, axis=1)
+        len_longest_row = counter_cur[pair_idxs, i2_longest_row]
+        longer = len_longest_row > len_longest
+        len_longest[longer] = len_longest_row[longer]
+        i1_longest[longer] = i1 + 1
+        i2_longest[longer] = i2_longest_row[longer]
 
-    counter_flat = counter.reshape(numpairs, (len_a1 + 1) * (len_a2 + 1))
-    idx_longest_raveled = np.argmax(counter_flat, axis=1)
-    len_longest = counter_flat[np.arange(counter_flat.shape[0]), idx_longest_raveled]
+        counter_prev, counter_cur = counter_cur, counter_prev
 
-    idx_longest = np.unravel_index(idx_longest_raveled, dims=(len_a1 + 1, len_a2 + 1))
-    a1idx_longest = idx_longest[0] - len_longest
-    a2idx_longest = idx_longest[1] - len_longest
+    a1idx_longest = i1_longest - len_longest
+    a2idx_longest = i2_longest - len_longest
 
     return a1idx_longest, a2idx_longest, len_longest
 
@@ -277,9 +617,12 @@ def longest_common_substrings_all_pairs_strings(seqs1: Sequence[str], seqs2: Seq
     return _longest_common_substrings_pairs(a1s, a2s)
 
 
-def _strongest_common_substrings_all_pairs_return_energies_and_counter(
-        a1s: np.ndarray, a2s: np.ndarray, temperature: float) \
-        -> Tuple[np.ndarray, np.ndarray]:
+def internal_loop_penalty(n: int, temperature: float) -> float:
+    return 1.5 + (2.5 * 0.002 * temperature * math.log(1 + n))
+
+
+def _strongest_common_substrings_all_pairs(a1s: np.ndarray, a2s: np.ndarray, temperature: float) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     assert len(a1s.shape) == 2
     assert len(a2s.shape) == 2
     assert a1s.shape[0] == a2s.shape[0]
@@ -287,70 +630,69 @@ def _strongest_common_substrings_all_pairs_return_energies_and_counter(
     numpairs = a1s.shape[0]
     len_a1 = a1s.shape[1]
     len_a2 = a2s.shape[1]
-    counter = np.zeros(shape=(len_a1 + 1, numpairs, len_a2 + 1), dtype=np.int)
-    energies = np.zeros(shape=(len_a1 + 1, numpairs, len_a2 + 1), dtype=np.float)
+
+    # only rows i1 and i1+1 of the dynamic programming tables are needed at once,
+    # so keep two rows of each and track the position of the strongest substring seen so far
+    assert max(len_a1, len_a2) <= _max_dp_seqlen
+    counter_prev = np.zeros(shape=(numpairs, len_a2 + 1), dtype=np.int16)
+    counter_cur = np.zeros(shape=(numpairs, len_a2 + 1), dtype=np.int16)
+    energies_prev = np.zeros(shape=(numpairs, len_a2 + 1), dtype=np.float32)
+    energies_cur = np.zeros(shape=(numpairs, len_a2 + 1), dtype=np.float32)
+    len_strongest = np.zeros(numpairs, dtype=np.int64)
+    energy_strongest = np.zeros(numpairs, dtype=np.float32)
+    i1_strongest = np.zeros(numpairs, dtype=np.int64)
+    i2_strongest = np.zeros(numpairs, dtype=np.int64)
+    pair_idxs = np.arange(numpairs)
 
     #     if not loop_energies:
     loop_energies = calculate_loop_energies(temperature)
 
-    prev_match_shifted_idxs = None
+    # match_idxs is a view of match_shifted_idxs offset by one column, so column 0 of
+    # match_shifted_idxs stays False; the previous row's matches are kept in a second buffer
+    match_shifted_idxs = np.zeros(shape=(numpairs, len_a2 + 1), dtype=np.bool_)
+    prev_match_shifted_idxs = np.zeros(shape=(numpairs, len_a2 + 1), dtype=np.bool_)
+    # both_match_idxs and both_match_shifted_idxs are views of this buffer offset by one column;
+    # its first and last columns stay False
+    both_match_buffer = np.zeros(shape=(numpairs, len_a2 + 2), dtype=np.bool_)
+    both_match_idxs = both_match_buffer[:, 1:]
+    both_match_shifted_idxs = both_match_buffer[:, :-1]
 
     for i1 in range(len_a1):
-        a1s_col = a1s[:, i1].reshape(numpairs, 1)
-        a1s_col_rp = np.repeat(a1s_col, len_a2, axis=1)
-
         # find matching chars and extend length of substring
-        match_idxs = (a2s == a1s_col_rp)
-        match_shifted_idxs = np.hstack([np.zeros(shape=(numpairs, 1), dtype=np.bool), match_idxs])
-        counter[i1 + 1, match_shifted_idxs] = counter[i1, match_idxs] + 1
+        match_idxs = match_shifted_idxs[:, 1:]
+        np.equal(a2s, a1s[:, i1:i1 + 1], out=match_idxs)
+        counter_cur.fill(0)
+        counter_cur[match_shifted_idxs] = counter_prev[:, :-1][match_idxs] + 1
 
+        energies_cur.fill(0)
         if i1 > 0:
             # calculate energy if matching substring has length > 1
             prev_bases = a1s[:, i1 - 1]
             cur_bases = a1s[:, i1]
             loops = (prev_bases << 2) + cur_bases
             latest_energies = loop_energies[loops].reshape(numpairs, 1)
-            latest_energies_rp = np.repeat(latest_energies, len_a2, axis=1)
-            match_idxs_false_at_end = np.hstack([match_idxs, np.zeros(shape=(numpairs, 1), dtype=np.bool)])
-            both_match_idxs = match_idxs_false_at_end & prev_match_shifted_idxs
-            prev_match_shifted_shifted_idxs = np.hstack(
-                [np.zeros(shape=(numpairs, 1), dtype=np.bool), prev_match_shifted_idxs])[:, :-1]
-            both_match_shifted_idxs = match_shifted_idxs & prev_match_shifted_shifted_idxs
-            energies[i1 + 1, both_match_shifted_idxs] = energies[i1, both_match_idxs] + latest_energies_rp[
-                both_match_idxs]
+            # broadcast view; does not copy the column len_a2 times
+            latest_energies_rp = np.broadcast_to(latest_energies, (numpairs, len_a2))
+            # substring continues where chars match in this row and the previous one (diagonally)
+            np.logical_and(match_idxs, prev_match_shifted_idxs[:, :-1], out=both_match_idxs[:, :-1])
+            energies_cur[both_match_shifted_idxs] = energies_prev[both_match_idxs] + latest_energies_rp[
+                both_match_idxs[:, :-1]]
+
+        i2_strongest_row = np.argmax(energies_cur, axis=1)
+        energy_strongest_row = energies_cur[pair_idxs, i2_strongest_row]
+        stronger = energy_strongest_row > energy_strongest
+        energy_strongest[stronger] = energy_strongest_row[stronger]
+        len_strongest[stronger] = counter_cur[pair_idxs, i2_strongest_row][stronger]
+        i1_strongest[stronger] = i1 + 1
+        i2_strongest[stronger] = i2_strongest_row[stronger]
 
         #         prev_match_idxs = match_idxs
-        prev_match_shifted_idxs = match_shifted_idxs
-
-    counter = counter.swapaxes(0, 1)
-    energies = energies.swapaxes(0, 1)
-
-    return counter, energies
-
-
-def internal_loop_penalty(n: int, temperature: float) -> float:
-    return 1.5 + (2.5 * 0.002 * temperature * math.log(1 + n))
+        prev_match_shifted_idxs, match_shifted_idxs = match_shifted_idxs, prev_match_shifted_idxs
+        counter_prev, counter_cur = counter_cur, counter_prev
+        energies_prev, energies_cur = energies_cur, energies_prev
 
-
-def _strongest_common_substrings_all_pairs(a1s: np.ndarray, a2s: np.ndarray, temperature: float) \
-        -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
-    numpairs = a1s.shape[0]
-    len_a1 = a1s.shape[1]
-    len_a2 = a2s.shape[1]
-
-    counter, energies = _strongest_common_substrings_all_pairs_return_energies_and_counter(a1s, a2s,
-                                                                                           temperature)
-
-    counter_flat = counter.reshape(numpairs, (len_a1 + 1) * (len_a2 + 1))
-    energies_flat = energies.reshape(numpairs, (len_a1 + 1) * (len_a2 + 1))
-
-    idx_strongest_raveled = np.argmax(energies_flat, axis=1)
-    len_strongest = counter_flat[np.arange(counter_flat.shape[0]), idx_strongest_raveled]
-    energy_strongest = energies_flat[np.arange(counter_flat.shape[0]), idx_strongest_raveled]
-
-    idx_strongest = np.unravel_index(idx_strongest_raveled, dims=(len_a1 + 1, len_a2 + 1))
-    a1idx_strongest = idx_strongest[0] - len_strongest
-    a2idx_strongest = idx_strongest[1] - len_strongest
+    a1idx_strongest = i1_strongest - len_strongest
+    a2idx_strongest = i2_strongest - len_strongest
 
     return a1idx_strongest, a2idx_strongest, len_strongest, energy_strongest
 
@@ -379,6 +721,88 @@ def energies_strongest_common_substrings(seqs1: Sequence[str], seqs2: Sequence[s
     return list(energy_strongest)
 
 
+@lru_cache(maxsize=64)
+def _substring_values(subs: Tuple[str, ...]) -> np.ndarray:
+    # values of subs in base 4 (first base least significant) as used by DNASeqList.filter_substring;
+    # shared between calls, so it is read-only
+    sublen = len(subs[0])
+    subints = [[base2bits[base] for base in sub] for sub in subs]
+    powarr = [4 ** k for k in range(sublen)]
+    subvals = np.dot(subints, powarr)
+    subvals.flags.writeable = False
+    return subvals
+
+
+# number of sequences processed at a time by DNASeqList.filter_substring
+_substring_chunk_size = 2 ** 14
+
+
+def _matches_none(windows: np.ndarray, subvals: np.ndarray) -> np.ndarray:
+    # which windows equal none of subvals
+    if len(subvals) <= 4:
+        no_match = windows != subvals[0]
+        for subval in subvals[1:]:
+            no_match &= windows != subval
+        return no_match
+    return ~np.isin(windows, subvals)
+
+
+def _no_substrings_packed(packed: np.ndarray, seqlen: int, sublen: int, subvals: np.ndarray) -> np.ndarray:
+    # which length-seqlen sequences, each packed into one (uint32 or uint64) word, have no length-sublen
+    # substring in subvals (of the same dtype); each window is a shift and mask of the word
+    word = packed.dtype.type
+    passall = np.ones(len(packed), dtype=np.bool_)
+    mask = word((1 << (2 * sublen)) - 1)
+    for start in range(seqlen - sublen + 1):
+        passall &= _matches_none((packed >> word(2 * start)) & mask, subvals)
+    return passall
+
+
+def _no_substrings_rolling(seqarr: np.ndarray, sublen: int, subvals: np.ndarray) -> np.ndarray:
+    # which rows of seqarr have no length-sublen substring in subvals; the window is updated as it
+    # slides right by dropping its first base (shifting right) and adding the next base as the most
+    # significant
+    numseqs, seqlen = seqarr.shape
+    window_dtype = subvals.dtype.type
+    passall = np.ones(numseqs, dtype=np.bool_)
+    window = np.zeros(numseqs, dtype=window_dtype)
+    for k in range(sublen):
+        window |= seqarr[:, k].astype(window_dtype) << window_dtype(2 * k)
+    top_shift = window_dtype(2 * (sublen - 1))
+    for i in range(sublen, seqlen + 1):
+        passall &= _matches_none(window, subvals)
+        if i < seqlen:
+            window >>= window_dtype(2)
+            window |= seqarr[:, i].astype(window_dtype) << top_shift
+    return passall
+
+
+def _no_g_quad_c_quad_packed(packed: np.ndarray) -> np.ndarray:
+    # which sequences, each packed into one (uint32 or uint64) word, have neither GGGG nor CCCC as a
+    # substring.
+    # C = 01 and G = 10 are the bases whose two bits differ, so a base starts a pair of identical G's
+    # or C's if its two bits differ and it equals the next base; a quadruplex is three such pairs in a
+    # row. Bits past the end of a sequence are 0 (A), which is neither G nor C, so never complete a pair.
+    word = packed.dtype.type
+    one = word(1)
+    two = word(2)
+    even_bits = word(int(_even_bits) & int(np.iinfo(packed.dtype).max))
+    gc = (packed ^ (packed >> one)) & even_bits
+    diff_next = packed ^ (packed >> two)
+    same_next = ~(diff_next | (diff_next >> one)) & even_bits
+    pairs = gc & same_next
+    quads = pairs & (pairs >> two) & (pairs >> word(4))
+    return quads == 0
+
+
+@lru_cache(maxsize=64)
+def _shift_for(seqlen: int) -> np.ndarray:
+    # DNASeqList.shift for sequences of length seqlen; shared between instances, so it is read-only
+    shift = np.arange(2 * (seqlen - 1), -1, -2)
+    shift.flags.writeable = False
+    return shift
+
+
 @dataclass
 class DNASeqList:
     """
@@ -448,7 +872,7 @@ class DNASeqList:
                 raise ValueError('exactly one of length, seqs, seqarra, or filename can be non-None')
         self.rng = rng
         if seqarr is not None:
-            self.seqarr = seqarr
+            self.seqarr = seqarr.astype(np.ubyte, copy=False)
             self.numseqs, self.seqlen = seqarr.shape
         elif seqs is not None:
             if len(seqs) == 0:
@@ -472,33 +896,127 @@ class DNASeqList:
         else:
             raise ValueError('at least one of length, seqs, seqarr, or filename must be specified')
 
-        self.shift = np.arange(2 * (self.seqlen - 1), -1, -2)
+        self._init_caches()
 
         if shuffle:
             self.shuffle()
 
+    @classmethod
+    def _from_seqarr_unchecked(cls, seqarr: np.ndarray) -> 'DNASeqList':
+        # Same as DNASeqList(seqarr=seqarr), for internal use by methods (such as filters) that
+        # already know seqarr is a valid 2D array, skipping validation of the constructor arguments.
+        seqs = cls.__new__(cls)
+        seqs.rng = default_rng
+        seqs.seqarr = seqarr
+        seqs.numseqs, seqs.seqlen = seqarr.shape
+        seqs._init_caches()
+        return seqs
+
+    def _init_caches(self) -> None:
+        # called once seqarr, numseqs, and seqlen are set
+        self.shift = _shift_for(self.seqlen)
+
+        self._seqarr_packed: Optional[np.ndarray] = None
+        self._seqarr_packed_source: Optional[np.ndarray] = None
+        self._packed_words_cache: Optional[np.ndarray] = None
+        self._packed_words_source: Optional[np.ndarray] = None
+
+        # number of occurrences of each packed row of seqarr, for __contains__
+        self._packed_rows_counts: Optional[Dict[Union[int, Tuple[int, ...]], int]] = None
+        self._packed_rows_counts_source: Optional[np.ndarray] = None
+
+        # buffer with spare rows for append_arr, whose first numseqs rows are _buffer_view; its first
+        # _buffer_rows_exposed rows have been part of seqarr, so arrays returned as seqarr may view them
+        self._buffer: Optional[np.ndarray] = None
+        self._buffer_view: Optional[np.ndarray] = None
+        self._buffer_rows_exposed = 0
+
     def __len__(self) -> int:
         return self.numseqs
 
+    @property
+    def seqarr_packed(self) -> np.ndarray:
+        """
+        :py:data:`DNASeqList.seqarr` packed at 2 bits per base into 64-bit words by :py:func:`pack_seqarr`.
+
+        Computed lazily and cached until :py:data:`DNASeqList.seqarr` is reassigned or shuffled.
+        """
+        if self._seqarr_packed_source is not self.seqarr:
+            self._seqarr_packed = pack_seqarr(self.seqarr)
+            self._seqarr_packed_source = self.seqarr
+        assert self._seqarr_packed is not None
+        return self._seqarr_packed
+
+    def _packed_words(self) -> np.ndarray:
+        # For sequences of length at most bases_per_word, 1D array with each sequence packed into a single
+        # word as in seqarr_packed, using uint32 words if they fit (up to 16 bases), to halve the memory
+        # traffic of scanning them. Cached like seqarr_packed.
+        assert self.seqlen <= bases_per_word
+        if self._packed_words_source is not self.seqarr:
+            packed = self.seqarr_packed[:, 0]
+            self._packed_words_cache = packed.astype(np.uint32) if self.seqlen <= 16 else packed
+            self._packed_words_source = self.seqarr
+        assert self._packed_words_cache is not None
+        return self._packed_words_cache
+
     def __contains__(self, seq: str) -> bool:
         if len(seq) != self.seqlen:
             return False
-        arr = seq2arr(seq)
-        return np.any(~np.any(self.seqarr - arr, 1))
+        # counts of packed rows are built on first use, updated by append_arr and pop_array, and
+        # rebuilt only if seqarr is otherwise reassigned (shuffling does not change them)
+        if self._packed_rows_counts_source is not self.seqarr:
+            self._packed_rows_counts = {}
+            for key in _packed_rows_keys(self.seqarr_packed):
+                self._packed_rows_counts[key] = self._packed_rows_counts.get(key, 0) + 1
+            self._packed_rows_counts_source = self.seqarr
+        assert self._packed_rows_counts is not None
+        return self._row_key(seq2arr(seq)) in self._packed_rows_counts
+
+    def _row_key(self, arr: np.ndarray) -> Union[int, Tuple[int, ...]]:
+        # key of 1D array arr (a single sequence) in _packed_rows_counts
+        return _packed_rows_keys(pack_seqarr(arr.reshape(1, self.seqlen)))[0]
 
     def _read_from_file(self, filename: str) -> None:
         """Reads from fileName in the format defined in writeToFile.
         Only meant to be called from constructor."""
-        with open(filename, 'r+') as f:
+        with open(filename, 'rb') as f:
             first_line = f.readline()
-            num_seqs_str, seq_len_str, temperature = first_line.split()
+            # header is "numseqs seqlen", possibly followed by other fields (e.g., a temperature)
+            num_seqs_str, seq_len_str = first_line.split()[:2]
             self.numseqs = int(num_seqs_str)
             self.seqlen = int(seq_len_str)
-            self.seqarr = np.empty((self.numseqs, self.seqlen), dtype=np.ubyte)
-            for i in range(self.numseqs):
-                line = f.readline()
-                seq = line.strip()
-                self.seqarr[i] = [base2bits[base] for base in seq]
+            if self.numseqs == 0:
+                self.seqarr = np.empty((0, self.seqlen), dtype=np.ubyte)
+                return
+
+            # as written by write_to_file, each sequence is on a line of exactly seqlen + 1 bytes,
+            # so the body can be decoded all at once as a 2D array; otherwise (e.g., Windows line
+            # endings or trailing whitespace) fall back to parsing line by line
+            stride = self.seqlen + 1
+            body_size = os.fstat(f.fileno()).st_size - len(first_line)
+            if body_size in (self.numseqs * stride, self.numseqs * stride - 1):
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    body = np.frombuffer(mm, dtype=np.ubyte, count=body_size, offset=len(first_line))
+                    # append newline if missing at end of file so that body reshapes to rows of length stride
+                    if body_size < self.numseqs * stride:
+                        body = np.append(body, np.ubyte(ord('\n')))
+                    rows = body.reshape(self.numseqs, stride)
+                    fixed_width = bool(np.all(rows[:, -1] == ord('\n')))
+                    if fixed_width:
+                        seqarr = _base2bits_lut[rows[:, :-1]]
+                        not_bases = seqarr == 255
+                        bad_char = chr(rows[:, :-1].flat[np.argmax(not_bases)]) if np.any(not_bases) else None
+                    # views into mm must be released before it is closed
+                    del body, rows
+                if fixed_width:
+                    if bad_char is not None:
+                        raise ValueError(f'DNA sequences must contain only bases {bits2base}, '
+                                         f'but found {bad_char!r}')
+                    self.seqarr = seqarr
+                    return
+
+            seqs = [f.readline().decode('ascii').strip() for _ in range(self.numseqs)]
+            self.seqarr = seqs2arr(seqs)
 
     def write_to_file(self, filename: str) -> None:
         """Writes text file describing DNA sequence list, in format
@@ -518,7 +1036,7 @@ class DNASeqList:
 
     def wcenergy(self, idx: int, temperature: float) -> float:
         """Return energy of idx'th sequence binding to its complement."""
-        return wcenergy(self.seqarr[idx], temperature)
+        return wcenergy(self.get_seq_str(idx), temperature)
 
     def __repr__(self) -> str:
         return 'DNASeqSet(seqs={})'.format(str([self[i] for i in range(self.numseqs)]))
@@ -533,11 +1051,14 @@ class DNASeqList:
             return ','.join(ret)
 
     def shuffle(self) -> None:
+        _evict_wc_energies_cache(self.seqarr)
         self.rng.shuffle(self.seqarr)
+        self._seqarr_packed_source = None
+        self._packed_words_source = None
 
     def to_list(self) -> List[str]:
         """Return list of strings representing the sequences, e.g. ['ACG','TAA']"""
-        return [self.get_seq_str(idx) for idx in range(self.numseqs)]
+        return arr2seqs(self.seqarr)
 
     def get_seq_str(self, idx: int) -> str:
         """Return idx'th DNA sequence as a string."""
@@ -545,12 +1066,7 @@ class DNASeqList:
 
     def get_seqs_str_list(self, slice_: slice) -> List[str]:
         """Return a list of strings specified by slice."""
-        bases_lst = self.seqarr[slice_]
-        ret = []
-        for bases in bases_lst:
-            bases_ch = [bits2base[base] for base in bases]
-            ret.append(''.join(bases_ch))
-        return ret
+        return arr2seqs(self.seqarr[slice_])
 
     def __getitem__(self, slice_: Union[int, slice]) -> Union[str, List[str]]:
         if isinstance(slice_, int):
@@ -562,55 +1078,132 @@ class DNASeqList:
 
     def pop(self) -> str:
         """Remove and return last seq, as a string."""
-        seq_str = self.get_seq_str(-1)
-        self.seqarr = np.delete(self.seqarr, -1, 0)
-        self.numseqs -= 1
-        return seq_str
+        return arr2seq(self.pop_array())
 
     def pop_array(self) -> np.ndarray:
-        """Remove and return last seq, as a string."""
-        arr = self.seqarr[-1]
-        self.seqarr = np.delete(self.seqarr, -1, 0)
+        """Remove and return last seq, as a numpy array."""
+        if self.numseqs == 0:
+            raise IndexError('pop from empty DNASeqList')
+        counts_current = self._packed_rows_counts_source is self.seqarr
+        buffer = self._get_buffer()
+        arr = buffer[self.numseqs - 1].copy()
         self.numseqs -= 1
+        if self.numseqs < len(buffer) // 4:
+            self._buffer = buffer = buffer[:len(buffer) // 2].copy()
+            self._buffer_rows_exposed = self.numseqs
+        self.seqarr = self._buffer_view = buffer[:self.numseqs]
+        if counts_current:
+            assert self._packed_rows_counts is not None
+            key = self._row_key(arr)
+            if self._packed_rows_counts[key] == 1:
+                del self._packed_rows_counts[key]
+            else:
+                self._packed_rows_counts[key] -= 1
+            self._packed_rows_counts_source = self.seqarr
         return arr
 
     def append_seq(self, newseq: str) -> None:
         self.append_arr(seq2arr(newseq))
 
     def append_arr(self, newarr: np.ndarray) -> None:
-        self.seqarr = np.vstack([self.seqarr, newarr])
+        counts_current = self._packed_rows_counts_source is self.seqarr
+        buffer = self._get_buffer()
+        if self.numseqs == len(buffer) or self.numseqs < self._buffer_rows_exposed:
+            # Copy to a new buffer if this one is full, doubling capacity so that appending n sequences
+            # copies O(n) rows in total, or if the row to write was part of seqarr before a pop_array,
+            # so that arrays previously returned as seqarr never change.
+            capacity = 2 * len(buffer) if self.numseqs == len(buffer) else len(buffer)
+            new_buffer = np.empty((max(1, capacity), self.seqlen), dtype=buffer.dtype)
+            new_buffer[:self.numseqs] = buffer[:self.numseqs]
+            self._buffer = buffer = new_buffer
+        buffer[self.numseqs] = newarr
         self.numseqs += 1
+        self._buffer_rows_exposed = self.numseqs
+        self.seqarr = self._buffer_view = buffer[:self.numseqs]
+        if counts_current:
+            assert self._packed_rows_counts is not None
+            key = self._row_key(buffer[self.numseqs - 1])
+            self._packed_rows_counts[key] = self._packed_rows_counts.get(key, 0) + 1
+            self._packed_rows_counts_source = self.seqarr
+
+    def _get_buffer(self) -> np.ndarray:
+        # Returns buffer used by append_arr and pop_array. If seqarr was assigned since the
+        # last call to either, it is copied to a new buffer, so that arrays passed into the
+        # constructor are never overwritten.
+        if self._buffer is None or self.seqarr is not self._buffer_view:
+            self._buffer = self._buffer_view = self.seqarr.copy()
+            self._buffer_rows_exposed = self.numseqs
+        return self._buffer
 
     def filter_hamming(self, threshold: int) -> None:
-        seq = self.pop_array()
-        arr_keep = np.array([seq])
-        self.shuffle()
-        while self.seqarr.shape[0] > 0:
-            seq = self.pop_array()
-            while self.seqarr.shape[0] > 0:
-                hamming_min = np.min(np.sum(np.bitwise_xor(arr_keep, seq) != 0, axis=1))
-                too_close = (hamming_min < threshold)
-                if not too_close:
-                    break
-                seq = self.pop_array()
-            arr_keep = np.vstack([arr_keep, seq])
-        self.seqarr = arr_keep
+        """Remove sequences (in place) until every pair of remaining sequences has Hamming distance at
+        least `threshold`.
+
+        The last sequence is kept, then the others are considered in random order, keeping each one
+        that is far enough from all sequences kept so far. If numba is installed this is done by a
+        compiled loop; otherwise candidates are compared against the kept sequences a block at a time,
+        followed by a short serial pass within each block, which gives the same result as considering
+        candidates one at a time."""
+        if self.numseqs == 0:
+            return
+        perm = np.arange(self.numseqs - 1)
+        self.rng.shuffle(perm)
+        order = np.concatenate(([self.numseqs - 1], perm[::-1]))
+
+        if numba is not None:
+            kept_idxs = np.empty(self.numseqs, dtype=np.intp)
+            num_kept = _filter_hamming_numba(self.seqarr, order, threshold, kept_idxs)
+            self.seqarr = self.seqarr[kept_idxs[:num_kept]]
+            self.numseqs = self.seqarr.shape[0]
+            return
+
+        packed = self.seqarr_packed[order]
+
+        kept_idxs = np.empty(self.numseqs, dtype=np.intp)
+        kept_packed = np.empty_like(packed)
+        num_kept = 0
+        start = 0
+        while start < self.numseqs:
+            # bound the (block, num_kept, numwords) temporary array
+            block_size = max(1, min(_hamming_block_size,
+                                    _hamming_block_elements // max(1, num_kept * packed.shape[1])))
+            block = packed[start:start + block_size]
+            if num_kept > 0:
+                distances = hamming_distances_packed(block[:, np.newaxis, :],
+                                                     kept_packed[np.newaxis, :num_kept, :])
+                far_from_kept = np.min(distances, axis=1) >= threshold
+            else:
+                far_from_kept = np.ones(len(block), dtype=bool)
+            num_kept_before_block = num_kept
+            for i in np.flatnonzero(far_from_kept):
+                if num_kept > num_kept_before_block:
+                    distances = hamming_distances_packed(kept_packed[num_kept_before_block:num_kept], block[i])
+                    if np.min(distances) < threshold:
+                        continue
+                kept_packed[num_kept] = block[i]
+                kept_idxs[num_kept] = start + i
+                num_kept += 1
+            start += len(block)
+
+        self.seqarr = self.seqarr[order[kept_idxs[:num_kept]]]
         self.numseqs = self.seqarr.shape[0]
 
     def hamming_min(self, arr: np.ndarray) -> int:
         """Returns minimum Hamming distance between arr and any sequence in
         this DNASeqList."""
-        distances = np.sum(np.bitwise_xor(self.seqarr, arr) != 0, axis=1)
+        if numba is None:
+            distances = hamming_distances_packed(self.seqarr_packed, pack_seqarr(arr.reshape(1, self.seqlen)))
+        else:
+            distances = hamming_distances(self.seqarr, arr)
         return np.min(distances)
 
     # remove quotes when Py3.6 support dropped
     def filter_energy(self, low: float, high: float, temperature: float) -> 'DNASeqList':
         """Return new DNASeqList with seqs whose wc complement energy is within
         the given range."""
-        wcenergies = calculate_wc_energies(self.seqarr, temperature)
-        within_range = (low <= wcenergies) & (wcenergies <= high)
+        within_range = wc_energies_within_range(self.seqarr, low, high, temperature)
         new_seqarr = self.seqarr[within_range]
-        return DNASeqList(seqarr=new_seqarr)
+        return DNASeqList._from_seqarr_unchecked(new_seqarr)
 
     def energies(self, temperature: float) -> np.ndarray:
         wcenergies = calculate_wc_energies(self.seqarr, temperature)
@@ -633,6 +1226,52 @@ class DNASeqList:
     #     new_seqarr = self.seqarr[within_range]
     #     return DNASeqList(seqarr=new_seqarr)
 
+    # remove quotes when Py3.6 support dropped
+    def filter(self,
+               end_gc: bool = False,
+               end_at: bool = False,
+               gc_near_end: bool = False,
+               base_counts: Optional[Dict[str, Tuple[int, int]]] = None,
+               base_at_pos: Optional[Dict[int, str]] = None,
+               energy_range: Optional[Tuple[float, float]] = None,
+               temperature: Optional[float] = None) -> 'DNASeqList':
+        """
+        Return new DNASeqList with seqs satisfying all of the given conditions.
+
+        This is equivalent to chaining the corresponding ``filter_*`` methods, but computes a single
+        boolean mask over :py:data:`DNASeqList.seqarr` and copies the passing sequences once,
+        instead of once per filter.
+
+        :param end_gc: as in :py:meth:`DNASeqList.filter_end_gc`
+        :param end_at: as in :py:meth:`DNASeqList.filter_end_at`
+        :param gc_near_end: `gc_near_end` parameter of :py:meth:`DNASeqList.filter_end_at`
+        :param base_counts: dict mapping a base to a pair (low, high), as in
+                            :py:meth:`DNASeqList.filter_base_count`
+        :param base_at_pos: dict mapping a position to a base, as in :py:meth:`DNASeqList.filter_base_at_pos`
+        :param energy_range: pair (low, high), as in :py:meth:`DNASeqList.filter_energy`
+        :param temperature: temperature for `energy_range`; must be specified if `energy_range` is
+        :return: new DNASeqList with seqs satisfying all of the given conditions
+        """
+        if energy_range is not None and temperature is None:
+            raise ValueError('temperature must be specified if energy_range is specified')
+        good = np.ones(self.numseqs, dtype=np.bool_)
+        if end_gc:
+            np.logical_and(good, self._end_gc_mask(), out=good)
+        if end_at:
+            np.logical_and(good, self._end_at_mask(gc_near_end), out=good)
+        if base_counts is not None:
+            for base, (low, high) in base_counts.items():
+                np.logical_and(good, self._base_count_mask(base, low, high), out=good)
+        if base_at_pos is not None:
+            for pos, base in base_at_pos.items():
+                np.logical_and(good, self._base_at_pos_mask(pos, base), out=good)
+        if energy_range is not None:
+            assert temperature is not None
+            low, high = energy_range
+            np.logical_and(good, wc_energies_within_range(self.seqarr, low, high, temperature), out=good)
+        seqarrpass = self.seqarr[good]
+        return DNASeqList._from_seqarr_unchecked(seqarrpass)
+
     # remove quotes when Py3.6 support dropped
     def filter_end_gc(self) -> 'DNASeqList':
         """Remove any sequence with A or T on the end. Also remove domains that
@@ -640,6 +1279,10 @@ class DNASeqList:
         we could get a domain ending in {C,G}^3, which, placed next to any
         domain ending in C or G, will create a substring in {C,G}^4 and be
         rejected if we are filtering those."""
+        seqarrpass = self.seqarr[self._end_gc_mask()]
+        return DNASeqList._from_seqarr_unchecked(seqarrpass)
+
+    def _end_gc_mask(self) -> np.ndarray:
         left = self.seqarr[:, 0]
         right = self.seqarr[:, -1]
         left_p1 = self.seqarr[:, 1]
@@ -653,14 +1296,17 @@ class DNASeqList:
         good = (((left == cbits) | (left == gbits)) & ((right == cbits) | (right == gbits)) &
                 ((left_p1 == abits) | (left_p1 == tbits) | (left_p2 == abits) | (left_p2 == tbits)) &
                 ((right_m1 == abits) | (right_m1 == tbits) | (right_m2 == abits) | (right_m2 == tbits)))
-        seqarrpass = self.seqarr[good]
-        return DNASeqList(seqarr=seqarrpass)
+        return good
 
     # remove quotes when Py3.6 support dropped
     def filter_end_at(self, gc_near_end: bool = False) -> 'DNASeqList':
         """Remove any sequence with C or G on the end. Also, if gc_near_end is True,
         remove domains that do not have an C or G either next to that base,
         or one away, to prevent breathing."""
+        seqarrpass = self.seqarr[self._end_at_mask(gc_near_end)]
+        return DNASeqList._from_seqarr_unchecked(seqarrpass)
+
+    def _end_at_mask(self, gc_near_end: bool) -> np.ndarray:
         left = self.seqarr[:, 0]
         right = self.seqarr[:, -1]
         abits = base2bits['A']
@@ -676,31 +1322,34 @@ class DNASeqList:
             good = (good &
                     ((left_p1 == cbits) | (left_p1 == gbits) | (left_p2 == cbits) | (left_p2 == gbits)) &
                     ((right_m1 == cbits) | (right_m1 == gbits) | (right_m2 == cbits) | (right_m2 == gbits)))
-        seqarrpass = self.seqarr[good]
-        return DNASeqList(seqarr=seqarrpass)
+        return good
 
     # remove quotes when Py3.6 support dropped
     def filter_base_nowhere(self, base: str) -> 'DNASeqList':
         """Remove any sequence that has given base anywhere."""
         good = (self.seqarr != base2bits[base]).all(axis=1)
         seqarrpass = self.seqarr[good]
-        return DNASeqList(seqarr=seqarrpass)
+        return DNASeqList._from_seqarr_unchecked(seqarrpass)
 
     # remove quotes when Py3.6 support dropped
     def filter_base_count(self, base: str, low: int, high: int) -> 'DNASeqList':
         """Remove any sequence not satisfying low <= #base <= high."""
+        seqarrpass = self.seqarr[self._base_count_mask(base, low, high)]
+        return DNASeqList._from_seqarr_unchecked(seqarrpass)
+
+    def _base_count_mask(self, base: str, low: int, high: int) -> np.ndarray:
         sumarr = np.sum(self.seqarr == base2bits[base], axis=1)
-        good = (low <= sumarr) & (sumarr <= high)
-        seqarrpass = self.seqarr[good]
-        return DNASeqList(seqarr=seqarrpass)
+        return (low <= sumarr) & (sumarr <= high)
 
     # remove quotes when Py3.6 support dropped
     def filter_base_at_pos(self, pos: int, base: str) -> 'DNASeqList':
         """Remove any sequence that does not have given base at position pos."""
+        seqarrpass = self.seqarr[self._base_at_pos_mask(pos, base)]
+        return DNASeqList._from_seqarr_unchecked(seqarrpass)
+
+    def _base_at_pos_mask(self, pos: int, base: str) -> np.ndarray:
         mid = self.seqarr[:, pos]
-        good = (mid == base2bits[base])
-        seqarrpass = self.seqarr[good]
-        return DNASeqList(seqarr=seqarrpass)
+        return mid == base2bits[base]
 
     # remove quotes when Py3.6 support dropped
     def filter_substring(self, subs: Sequence[str]) -> 'DNASeqList':
@@ -708,17 +1357,34 @@ class DNASeqList:
         if len(set([len(sub) for sub in subs])) != 1:
             raise ValueError('All substrings in subs must be equal length: %s' % subs)
         sublen = len(subs[0])
-        subints = [[base2bits[base] for base in sub] for sub in subs]
-        powarr = [4 ** k for k in range(sublen)]
-        subvals = np.dot(subints, powarr)
-        toeplitz = create_toeplitz(self.seqlen, sublen)
-        convolution = np.dot(toeplitz, self.seqarr.transpose())
-        passall = np.ones(self.numseqs, dtype=np.bool)
-        for subval in subvals:
-            passsub = np.all(convolution != subval, axis=0)
-            passall = passall & passsub
+        if sublen > bases_per_word:
+            raise ValueError(f'substrings can have length at most {bases_per_word}, '
+                             f'but they have length {sublen}')
+        if sublen > self.seqlen:
+            # no sequence is long enough to contain any of subs
+            return DNASeqList._from_seqarr_unchecked(self.seqarr.copy())
+        subvals_int = _substring_values(tuple(subs))
+
+        # windows are compared by their value in the same base-4 encoding as subvals (first base least
+        # significant), which is also how seqarr_packed stores bases
+        if self.seqlen <= bases_per_word:
+            # each sequence is a single packed word
+            packed = self._packed_words()
+            subvals = subvals_int.astype(packed.dtype)
+        else:
+            # windows of up to 16 bases fit in 32 bits, halving the memory traffic
+            subvals = subvals_int.astype(np.uint32 if sublen <= 16 else np.uint64)
+
+        # process the sequences in chunks, so that the windows and masks of a chunk stay in cache
+        passall = np.empty(self.numseqs, dtype=np.bool_)
+        for start in range(0, self.numseqs, _substring_chunk_size):
+            end = min(start + _substring_chunk_size, self.numseqs)
+            if self.seqlen <= bases_per_word:
+                passall[start:end] = _no_substrings_packed(packed[start:end], self.seqlen, sublen, subvals)
+            else:
+                passall[start:end] = _no_substrings_rolling(self.seqarr[start:end], sublen, subvals)
         seqarrpass = self.seqarr[passall]
-        return DNASeqList(seqarr=seqarrpass)
+        return DNASeqList._from_seqarr_unchecked(seqarrpass)
 
     # remove quotes when Py3.6 support dropped
     def filter_seqs_by_g_quad(self) -> 'DNASeqList':
@@ -728,7 +1394,24 @@ class DNASeqList:
     # remove quotes when Py3.6 support dropped
     def filter_seqs_by_g_quad_c_quad(self) -> 'DNASeqList':
         """Removes any sticky ends with 4 G's or C's in a row (a quadruplex)."""
-        return self.filter_substring(['GGGG', 'CCCC'])
+        seqarrpass = self.seqarr[self._g_quad_c_quad_mask()]
+        return DNASeqList._from_seqarr_unchecked(seqarrpass)
+
+    def _g_quad_c_quad_mask(self) -> np.ndarray:
+        # equivalent to checking substrings GGGG and CCCC, but for sequences in single packed words,
+        # checks each word with a few bitwise operations rather than comparing every window
+        if self.seqlen > bases_per_word:
+            subvals = _substring_values(('GGGG', 'CCCC')).astype(np.uint32)
+        else:
+            packed = self._packed_words()
+        passall = np.empty(self.numseqs, dtype=np.bool_)
+        for start in range(0, self.numseqs, _substring_chunk_size):
+            end = min(start + _substring_chunk_size, self.numseqs)
+            if self.seqlen > bases_per_word:
+                passall[start:end] = _no_substrings_rolling(self.seqarr[start:end], 4, subvals)
+            else:
+                passall[start:end] = _no_g_quad_c_quad_packed(packed[start:end])
+        return passall
 
 
 def create_toeplitz(seqlen: int, sublen: int) -> np.ndarray:
@@ -743,22 +1426,33 @@ def create_toeplitz(seqlen: int, sublen: int) -> np.ndarray:
     # else:
     rows = seqlen - (sublen - 1)
     cols = seqlen
-    toeplitz = np.zeros((rows, cols), dtype=np.int)
-    toeplitz[:, 0:sublen] = [powarr] * rows
-    shift = list(range(rows))
-    for i in range(rows):
-        toeplitz[i] = np.roll(toeplitz[i], shift[i])
+    toeplitz = np.zeros((rows, cols), dtype=np.int64)
+    # row i has powarr in columns i through i+sublen-1
+    row_idxs = np.arange(rows)[:, np.newaxis]
+    toeplitz[row_idxs, row_idxs + np.arange(sublen)] = powarr
     return toeplitz
 
 
-@lru_cache(maxsize=32)
 def calculate_loop_energies(temperature: float, negate: bool = False) -> np.ndarray:
     """Get SantaLucia and Hicks nearest-neighbor loop energies for given temperature,
-    1 M Na+. """
-    energies = (_dH - (temperature + 273.15) * _dS / 1000.0)
-    if negate:
-        energies = -energies
-    return energies
+    1 M Na+.
+
+    The result is cached (for `temperature` rounded to 3 decimal places) and shared between calls,
+    so it is read-only."""
+    if temperature == 37.0:
+        # most common temperature; skip the rounding and cache lookup
+        return _LOOP_E_37[1 if negate else 0]
+    return _loop_energies_pair(round(temperature, 3))[1 if negate else 0]
+
+
+@lru_cache(maxsize=64)
+def _loop_energies_pair(temperature: float) -> Tuple[np.ndarray, np.ndarray]:
+    # loop energies and their negations, computed together so that both share one cache entry
+    energies = (_dH - (temperature + 273.15) * _dS / 1000.0).astype(np.float32)
+    energies.flags.writeable = False
+    negated_energies = -energies
+    negated_energies.flags.writeable = False
+    return energies, negated_energies
     # SantaLucia & Hicks' values are in cal/mol/K for dS, and kcal/mol for dH.
     # Here we divide dS by 1000 to get the RHS term into units of kcal/mol/K
     # which gives an overall dG in units of kcal/mol.
@@ -781,6 +1475,13 @@ _dS = np.array([-21.3, -22.4, -21.0, -20.4, -22.7, -19.9, -27.2, -21.0,
                 -22.2, -24.4, -19.9, -22.4, -21.3, -22.2, -22.7, -21.3],
                dtype=np.float32)
 
+# precompute loop energies for commonly used temperatures
+for _temperature in (37.0, 53.0):
+    _loop_energies_pair(_temperature)
+
+# (loop energies, negated loop energies) at 37 C
+_LOOP_E_37 = _loop_energies_pair(37.0)
+
 #  AA  AC  AG  AT  CA  CC  CG  CT  GA  GC  GG  GT  TA  TC  TG  TT
 #  00  01  02  03  10  11  12  13  20  21  22  23  30  31  32  34
 
@@ -813,7 +1514,10 @@ _all_pairs = [((i << 2) + j, bits2base[i] + bits2base[j])
 @lru_cache(maxsize=32)
 def calculate_loop_energies_dict(temperature: float, negate: bool = False) -> Dict[str, float]:
     loop_energies = calculate_loop_energies(temperature, negate)
-    return {pair[1]: loop_energies[pair[0]] for pair in _all_pairs}
+    # convert to a list first so that values are Python floats rather than numpy scalars,
+    # so that wcenergy sums them without numpy scalar arithmetic
+    energies_list = loop_energies.tolist()
+    return {pair[1]: energies_list[pair[0]] for pair in _all_pairs}
 
 
 @lru_cache(maxsize=100000)
@@ -823,53 +1527,188 @@ def wcenergy(seq: str, temperature: float, negate: bool = False) -> float:
     return sum(loop_energies[seq[i:i + 2]] for i in range(len(seq) - 1))
 
 
+# below this many sequences, wcenergies_str sums energies of each sequence with (cached) wcenergy
+# rather than converting them to an array; the vectorized path costs about 10 us for a small batch,
+# versus about 0.5 us per sequence for wcenergy on a cache hit and 3.3 us on a miss, so this favors
+# the repeated sequences common in search loops while bounding the cost of a batch of all misses
+_wcenergies_str_min_vectorized = 8
+
+
 def wcenergies_str(seqs: Sequence[str], temperature: float, negate: bool = False) -> List[float]:
+    # Both paths return float32 energies equal to those of calculate_wc_energies: wcenergy's float64 sum
+    # of float32 loop energies is exact, so rounding it to float32 gives the same value.
+    if len(seqs) < _wcenergies_str_min_vectorized:
+        return [np.float32(wcenergy(seq.upper(), temperature, negate)) for seq in seqs]
     seqarr = seqs2arr(seqs)
     return list(calculate_wc_energies(seqarr, temperature, negate))
 
 
 def wcenergy_str(seq: str, temperature: float, negate: bool = False) -> float:
-    seqarr = seqs2arr([seq])
-    return list(calculate_wc_energies(seqarr, temperature, negate))[0]
+    return np.float32(wcenergy(seq.upper(), temperature, negate))
 
 
 def hash_ndarray(arr: np.ndarray) -> int:
-    writeable = arr.flags.writeable
-    if writeable:
-        arr.flags.writeable = False
-    h = hash(bytes(arr.data))  # hash(arr.data)
-    arr.flags.writeable = writeable
-    return h
+    # hashes the array's buffer in place (unless arr is not C-contiguous), rather than copying it to bytes
+    data = np.ascontiguousarray(arr).reshape(-1).view(np.ubyte)
+    if xxhash is not None:
+        return xxhash.xxh3_64_intdigest(data)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
 
 
 CACHE_WC = False
-_calculate_wc_energies_cache: Optional[np.ndarray] = None
-_calculate_wc_energies_cache_hash: int = 0
+
+# If CACHE_WC is True, maps (id(seqarr), seqarr.shape, temperature, negate) to a weak reference to
+# seqarr and its energies, for the most recent _calculate_wc_energies_cache_size calls. The weak
+# reference confirms that the id is still that of the same array rather than a new one reusing it.
+# Arrays are identified by identity, not contents, so code modifying an array in place must call
+# _evict_wc_energies_cache on it, as DNASeqList does.
+_calculate_wc_energies_cache: Dict[Tuple[int, Tuple[int, ...], float, bool],
+                                   Tuple['weakref.ReferenceType[np.ndarray]', np.ndarray]] = {}
+_calculate_wc_energies_cache_size = 16
+
+
+def _evict_wc_energies_cache(arr: np.ndarray) -> None:
+    # removes cached energies of any array that may share memory with arr (e.g., arr itself or a view
+    # of the same buffer), since arr is about to be modified in place
+    if not _calculate_wc_energies_cache:
+        return
+    for key, (arr_ref, _) in list(_calculate_wc_energies_cache.items()):
+        cached_arr = arr_ref()
+        if cached_arr is None or np.may_share_memory(cached_arr, arr):
+            _calculate_wc_energies_cache.pop(key, None)
+
+
+# per-thread buffers (pair_indices, pair_energies) from the most recent call to calculate_wc_energies,
+# kept only if together they take at most _wc_energies_buffers_max_bytes, so that a call on a large
+# array does not leave its buffers allocated afterwards
+_wc_energies_buffers_local = threading.local()
+_wc_energies_buffers_max_bytes = 2 ** 24
+
+
+def _wc_energies_buffers(seqarr: np.ndarray, loop_energies: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # buffers for the loop indices and energies of seqarr, reused if the previous call in this thread
+    # had the same shape and dtypes, since filters often compute energies of many same-shape arrays
+    shape = (seqarr.shape[0], max(0, seqarr.shape[1] - 1))
+    buffers = getattr(_wc_energies_buffers_local, 'buffers', None)
+    if (buffers is None or buffers[0].shape != shape or buffers[0].dtype != seqarr.dtype
+            or buffers[1].dtype != loop_energies.dtype):
+        buffers = (np.empty(shape, dtype=seqarr.dtype), np.empty(shape, dtype=loop_energies.dtype))
+        if buffers[0].nbytes + buffers[1].nbytes <= _wc_energies_buffers_max_bytes:
+            _wc_energies_buffers_local.buffers = buffers
+        else:
+            _wc_energies_buffers_local.buffers = None
+    return buffers
 
 
 def calculate_wc_energies(seqarr: np.ndarray, temperature: float, negate: bool = False) -> np.ndarray:
     """Calculate and store in an array all energies of all sequences in seqarr
-    with their Watson-Crick complements."""
-    global _calculate_wc_energies_cache
-    global _calculate_wc_energies_cache_hash
-    if CACHE_WC and _calculate_wc_energies_cache is not None:
-        if _calculate_wc_energies_cache_hash == hash_ndarray(seqarr):
-            return _calculate_wc_energies_cache
+    with their Watson-Crick complements.
+
+    The float32 loop energies of each sequence are summed in float64 and the sum is rounded once to
+    float32. Sums of float32 loop energies are exact in float64 for any practical sequence length,
+    so the result does not depend on summation order (and so not on whether numba is installed)."""
+    cache_key = (id(seqarr), seqarr.shape, temperature, negate)
+    if CACHE_WC:
+        cached = _calculate_wc_energies_cache.get(cache_key)
+        if cached is not None and cached[0]() is seqarr:
+            return cached[1]
+        seqarr_ref = weakref.ref(seqarr)
     loop_energies = calculate_loop_energies(temperature, negate)
-    left_index_bits = seqarr[:, :-1] << 2
-    right_index_bits = seqarr[:, 1:]
-    pair_indices = left_index_bits + right_index_bits
-    pair_energies = loop_energies[pair_indices]
-    energies: np.ndarray = np.sum(pair_energies, axis=1)
+    # loop indices are < 16, so with bytes the indices below are computed and gathered as bytes
+    seqarr = seqarr.astype(np.ubyte, copy=False)
+    energies: np.ndarray
+    if numba is not None:
+        # sums the loop energies of each sequence in one compiled pass, without the temporary arrays
+        energies = np.empty(seqarr.shape[0], dtype=loop_energies.dtype)
+        _calculate_wc_energies_numba(seqarr, loop_energies, energies)
+    else:
+        pair_indices, pair_energies = _wc_energies_buffers(seqarr, loop_energies)
+        np.left_shift(seqarr[:, :-1], 2, out=pair_indices)
+        np.add(pair_indices, seqarr[:, 1:], out=pair_indices)
+        # indices are known to be in bounds, so clip mode skips checking them
+        loop_energies.take(pair_indices, out=pair_energies, mode='clip')
+        energies = np.sum(pair_energies, axis=1, dtype=np.float64).astype(loop_energies.dtype)
     if CACHE_WC:
-        _calculate_wc_energies_cache = energies
-        _calculate_wc_energies_cache_hash = hash_ndarray(_calculate_wc_energies_cache)
+        if cache_key not in _calculate_wc_energies_cache \
+                and len(_calculate_wc_energies_cache) >= _calculate_wc_energies_cache_size:
+            # evict oldest entry
+            del _calculate_wc_energies_cache[next(iter(_calculate_wc_energies_cache))]
+        _calculate_wc_energies_cache[cache_key] = (seqarr_ref, energies)
     return energies
 
 
+def wc_energies_within_range(seqarr: np.ndarray, low: float, high: float, temperature: float) -> np.ndarray:
+    """Return boolean array indicating which sequences in seqarr have energy with their
+    Watson-Crick complements in the range [`low`, `high`].
+
+    Energies are those returned by :py:func:`calculate_wc_energies`, and are compared with `low` and
+    `high` rounded to the same float32 type, so that a sequence whose energy is reported as exactly
+    `low` or `high` is in range. If numba is installed, the energies are summed and compared in one
+    compiled pass without storing them, stopping early on a sequence once its partial sum has left
+    the range for good."""
+    loop_energies = calculate_loop_energies(temperature)
+    low = loop_energies.dtype.type(low)
+    high = loop_energies.dtype.type(high)
+    if numba is None:
+        wcenergies = calculate_wc_energies(seqarr, temperature)
+        return (low <= wcenergies) & (wcenergies <= high)
+    # float32 neighbors of the range; a partial sum at or past one of these rounds to outside the range
+    below_low = float(np.nextafter(low, -np.inf))
+    above_high = float(np.nextafter(high, np.inf))
+    within_range = np.empty(seqarr.shape[0], dtype=np.bool_)
+    _wc_energies_within_range_numba(seqarr, loop_energies, low, high, below_low, above_high,
+                                    bool(np.all(loop_energies <= 0)), bool(np.all(loop_energies >= 0)),
+                                    within_range)
+    return within_range
+
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True, boundscheck=False)
+    def _calculate_wc_energies_numba(seqarr: np.ndarray, loop_energies: np.ndarray,
+                                     energies: np.ndarray) -> None:
+        # accumulates in float64; storing into the float32 energies rounds once, as calculate_wc_energies states
+        numseqs, seqlen = seqarr.shape
+        for i in numba.prange(numseqs):
+            energy = 0.0
+            for j in range(1, seqlen):
+                energy += loop_energies[(seqarr[i, j - 1] << 2) | seqarr[i, j]]
+            energies[i] = energy
+
+    @numba.njit(parallel=True, cache=True, boundscheck=False)
+    def _wc_energies_within_range_numba(seqarr: np.ndarray, loop_energies: np.ndarray,
+                                        low: float, high: float, below_low: float, above_high: float,
+                                        nonincreasing: bool, nondecreasing: bool,
+                                        within_range: np.ndarray) -> None:
+        # Sums as _calculate_wc_energies_numba does and compares the sum rounded to float32, so the
+        # result agrees with the energies calculate_wc_energies returns. If all loop energies have the
+        # same sign, the partial sums are monotone, so a sequence can be rejected as soon as its partial
+        # sum reaches below_low (or above_high): the final sum then rounds to a float32 outside the range.
+        numseqs, seqlen = seqarr.shape
+        for i in numba.prange(numseqs):
+            energy = 0.0
+            for j in range(1, seqlen):
+                energy += loop_energies[(seqarr[i, j - 1] << 2) | seqarr[i, j]]
+                if (nonincreasing and energy <= below_low) or (nondecreasing and energy >= above_high):
+                    break
+            rounded = np.float32(energy)
+            within_range[i] = low <= rounded <= high
+
+
 def wc_arr(seqarr: np.ndarray) -> np.ndarray:
-    """Return numpy array of complements of sequences in `seqarr`."""
-    return (3 - seqarr)[:, ::-1]
+    """Return (newly allocated) numpy array of complements of sequences in `seqarr`."""
+    out = np.empty_like(seqarr)
+    wc_arr_into(seqarr, out)
+    return out
+
+
+def wc_arr_into(seqarr: np.ndarray, out: np.ndarray) -> None:
+    """Write complements of sequences in `seqarr` into `out`, which must have the same shape as `seqarr`
+    (and must not overlap it). Useful for reusing one buffer for the complements of many arrays."""
+    np.subtract(3, seqarr[:, ::-1], out=out)
+
+
+FORBIDDEN_GC4: Tuple[str, ...] = tuple(''.join(sub) for sub in it.product(['G', 'C'], repeat=4))
+"""All 16 strings of length 4 over {G, C}, which :py:func:`prefilter_length_10_11` forbids as substrings."""
 
 
 def prefilter_length_10_11(low_dg: float, high_dg: float, temperature: float, end_gc: bool,
@@ -880,12 +1719,8 @@ def prefilter_length_10_11(low_dg: float, high_dg: float, temperature: float, en
     s11: DNASeqList = DNASeqList(length=11)
     s10 = s10.filter_energy(low=low_dg, high=high_dg, temperature=temperature)
     s11 = s11.filter_energy(low=low_dg, high=high_dg, temperature=temperature)
-    forbidden_subs = [f'{a}{b}{c}{d}' for a in ['G', 'C']
-                      for b in ['G', 'C']
-                      for c in ['G', 'C']
-                      for d in ['G', 'C']]
-    s10 = s10.filter_substring(forbidden_subs)
-    s11 = s11.filter_substring(forbidden_subs)
+    s10 = s10.filter_substring(FORBIDDEN_GC4)
+    s11 = s11.filter_substring(FORBIDDEN_GC4)
     if end_gc:
         print(
             'Removing any domains that end in either A or T; '
@@ -914,15 +1749,19 @@ def all_cats(seq: Sequence[int], seqs: Sequence[int]) -> np.ndarray:
 
     .. code-block:: Python
 
-        [[0,1,2,3,3,3,3],
-         [3,3,3,0,1,2,3],
-         [0,1,2,3,0,0,0],
-         [0,0,0,0,1,2,3]]
+        [[3,3,3,0,1,2,3],
+         [0,0,0,0,1,2,3],
+         [0,1,2,3,3,3,3],
+         [0,1,2,3,0,0,0]]
     """
-    seqarr = np.asarray([seq])
+    seqarr = np.asarray(seq)
     seqsarr = np.asarray(seqs)
-    ar = seqarr.repeat(seqsarr.shape[0], axis=0)
-    ret = np.concatenate((seqsarr, ar), axis=1)
-    ret2 = np.concatenate((ar, seqsarr), axis=1)
-    ret = np.concatenate((ret, ret2))
+    numseqs, len_seqs = seqsarr.shape
+    len_seq = seqarr.shape[0]
+    # fill the result in place; seq is broadcast across rows rather than repeated
+    ret = np.empty((2 * numseqs, len_seqs + len_seq), dtype=np.result_type(seqarr, seqsarr))
+    ret[:numseqs, :len_seqs] = seqsarr
+    ret[:numseqs, len_seqs:] = seqarr
+    ret[numseqs:, :len_seq] = seqarr
+    ret[numseqs:, len_seq:] = seqsarr
     return ret